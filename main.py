@@ -1,3 +1,4 @@
+import argparse
 import pandas as pd
 import sys
 
@@ -12,9 +13,14 @@ except ImportError:
     print("Fatal! Source Broken. Please Install Source Packages")
 
 
-def run_analysis():
+def run_analysis(headless=False, out_dir=None):
     """
     Main orchestration function.
+
+    Args:
+        headless (bool): Save the performance charts to a file instead of
+                         opening them, for runs without a display.
+        out_dir (str): Directory for the saved charts when headless.
     """
     print("--- Starting Parallel Computing Analysis ---")
 
@@ -35,14 +41,14 @@ def run_analysis():
     print("Data loaded successfully.")
 
     # Profile rolling analytics and get metrics
-    rolling_metrics = metrics.profile_rolling_analytics(df_pd, df_pl)
+    rolling_metrics = metrics.profile_rolling_analytics(df_pd, df_pl, data_loader.scan_polars())
 
     # Get the pandas df with metrics for visualization (Task 2)
     df_pd_with_metrics = rolling_metrics["df_pd_rolling"]
     metrics.visualize_symbol_metrics(df_pd_with_metrics, symbol="AAPL")  # You can change 'AAPL'
 
     # Profile the parallel strategies
-    parallel_metrics = parallel.profile_parallelism(df_pd)
+    parallel_metrics = parallel.profile_parallelism(df_pd, df_pl)
 
     # Profile the portfolio aggregation
     # Make sure 'portfolio_structure-1.json' is in the same directory
@@ -63,6 +69,8 @@ def run_analysis():
                 "3. Parallelism - Sequential (s)",
                 "3. Parallelism - Threading (s)",
                 "3. Parallelism - Multiprocessing (s)",
+                "3. Parallelism - Numba JIT (s)",
+                "3. Parallelism - Polars Native (s)",
                 "4. Portfolio Aggregation - Sequential (s)",
                 "4. Portfolio Aggregation - Parallel (s)"
             ],
@@ -73,6 +81,8 @@ def run_analysis():
                 parallel_metrics["sequential_time"],
                 parallel_metrics["threading_time"],
                 parallel_metrics["processing_time"],
+                parallel_metrics["numba_time"],
+                None,  # Polars-only strategy
                 portfolio_metrics["portfolio_seq_time"],
                 portfolio_metrics["portfolio_par_time"]
             ],
@@ -84,13 +94,15 @@ def run_analysis():
                 None,  # N/A for this task
                 None,  # N/A for this task
                 None,  # N/A for this task
+                parallel_metrics["polars_time"],
+                None,  # N/A for this task
                 None  # N/A for this task
             ]
         }
         df_performance = pd.DataFrame(performance_data)
 
         print("Performance Summary DataFrame:")
-        print(df_performance.to_markdown(index=False))
+        print(reporting.to_markdown_table(df_performance))
 
     except KeyError as e:
         print(f"Fatal Error: A metric key is missing: {e}. Cannot build report.")
@@ -99,18 +111,23 @@ def run_analysis():
         print(f"Fatal Error: Failed to build performance dataframe: {e}")
         sys.exit(1)
 
-    # Generate the .md report file
-    report_content = reporting.generate_performance_report(df_performance)
+    # Generate the .md report file, streamed straight to disk
     try:
         with open("performance_report.md", "w", encoding="utf-8") as f:
-            f.write(report_content)
+            reporting.write_performance_report(df_performance, f)
         print("\nSuccessfully generated 'performance_report.md'")
     except Exception as e:
         print(f"Error writing report file: {e}")
-    reporting.plot_performance_charts(df_performance)
+    reporting.plot_performance_charts(df_performance, interactive=not headless, out_dir=out_dir)
 
     print("Analysis Complete/")
 
 
 if __name__ == "__main__":
-    run_analysis()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the parallel computing analysis.")
+    parser.add_argument("--headless", action="store_true",
+                        help="save the performance charts as a PNG (HTML without kaleido) instead of showing them")
+    parser.add_argument("--out-dir", default=None,
+                        help="directory for the saved charts (default: working directory)")
+    args = parser.parse_args()
+    run_analysis(headless=args.headless, out_dir=args.out_dir)
\ No newline at end of file
@@ -2,12 +2,30 @@ import pandas as pd
 import polars as pl
 import numpy as np
 import time
-import plotly.express as px
+import plotly.graph_objects as go
 import plotly.io as pio
+from pandas.api.indexers import BaseIndexer
 
 pio.templates.default = "plotly_white"
 
 
+class GroupRollingIndexer(BaseIndexer):
+    """
+    Trailing fixed-size windows over a flat array sorted by group, clipped so
+    no window reaches back past the first row of its own group.
+
+    Args:
+        window_size (int): The rolling window period.
+        group_starts (np.ndarray): For every row, the position of the first
+                                   row of the group it belongs to.
+    """
+
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        end = np.arange(1, num_values + 1, dtype=np.int64)
+        start = np.maximum(end - self.window_size, self.group_starts)
+        return start, end
+
+
 def compute_rolling_pandas(df, window=20):
     """
     Computes 20-period rolling metrics (SMA, Vol, Sharpe) using pandas.
@@ -21,17 +39,31 @@ def compute_rolling_pandas(df, window=20):
         pd.DataFrame: The original DataFrame with new columns for
                       'sma_20', 'vol_20', and 'sharpe_20'.
     """
-    df = df.reset_index()
+    # Sorting (by the 'timestamp' index level) yields the one new frame this
+    # function writes to, so callers' frames are never mutated and need no copy
     df = df.sort_values(by=['symbol', 'timestamp'])
-    grouped = df.groupby('symbol')
-    df['sma_20'] = grouped['price'].rolling(window=window).mean().reset_index(level=0, drop=True)
-    df['vol_20'] = grouped['price'].rolling(window=window).std().reset_index(level=0, drop=True)
-    returns = grouped['price'].pct_change()
-    rolling_mean_ret = returns.rolling(window=window).mean()
-    rolling_std_ret = returns.rolling(window=window).std()
-    df['sharpe_20'] = (rolling_mean_ret / rolling_std_ret)
-    df.replace([np.inf, -np.inf], np.nan, inplace=True)
-    df = df.set_index('timestamp')
+
+    # Rows are now contiguous per symbol, so one indexer bounded by the group
+    # starts lets the flat rolling kernels run once over the whole column
+    # instead of realigning a MultiIndex after every groupby().rolling() call.
+    codes = pd.factorize(df['symbol'])[0]
+    positions = np.arange(len(df))
+    is_start = np.ones(len(df), dtype=bool)
+    is_start[1:] = codes[1:] != codes[:-1]
+    group_starts = np.maximum.accumulate(np.where(is_start, positions, 0))
+    indexer = GroupRollingIndexer(window_size=window, group_starts=group_starts)
+
+    prices = pd.Series(df['price'].to_numpy(dtype=np.float64, na_value=np.nan))
+    returns = prices.pct_change()
+    returns[is_start] = np.nan
+
+    rolling_prices = prices.rolling(indexer, min_periods=window)
+    rolling_returns = returns.rolling(indexer, min_periods=window)
+    df['sma_20'] = rolling_prices.mean().to_numpy()
+    df['vol_20'] = rolling_prices.std().to_numpy()
+    sharpe = (rolling_returns.mean() / rolling_returns.std()).to_numpy()
+    sharpe[~np.isfinite(sharpe)] = np.nan
+    df['sharpe_20'] = sharpe
 
     return df
 
@@ -42,13 +74,32 @@ def compute_drawdown(price_series):
     max_drawdown = drawdowns.min()
     return max_drawdown if pd.notna(max_drawdown) else 0.0
 
+def compute_drawdown_by_symbol(symbols, prices):
+    """
+    Vectorized compute_drawdown for many symbols at once: one grouped
+    cummax pass over the flat price array instead of one per symbol.
+
+    Args:
+        symbols (array-like): The symbol of each row; each symbol's rows in time order.
+        prices (array-like): The price of each row.
+
+    Returns:
+        pd.Series: The max drawdown per symbol (0.0 where it is undefined).
+    """
+    prices = pd.Series(prices, dtype='float64')
+    cumulative_max = prices.groupby(symbols, sort=False).cummax()
+    drawdowns = (prices - cumulative_max) / cumulative_max
+    return drawdowns.groupby(symbols, sort=False).min().fillna(0.0)
+
 def compute_rolling_polars(df, window=20):
     """
     Computes 20-period rolling metrics (SMA, Vol, Sharpe) using polars.
 
     Args:
-        df (pl.DataFrame): Input Polars DataFrame with columns
-                           'timestamp', 'symbol', and 'price'.
+        df (pl.DataFrame | pl.LazyFrame): Input Polars frame with columns
+                           'timestamp', 'symbol', and 'price'. A LazyFrame
+                           (e.g. from data_loader.scan_polars) is extended
+                           and collected once, as a single query plan.
         window (int): The rolling window period.
 
     Returns:
@@ -56,23 +107,21 @@ def compute_rolling_polars(df, window=20):
                       'sma_20', 'vol_20', and 'sharpe_20'.
     """
 
-    df = df.sort("symbol", "timestamp")
+    # Each symbol's rows only need to be in time order, which a timestamp sort
+    # already gives (and is a no-op on load_polars output); .over("symbol") then
+    # groups by hash instead of paying for a full (symbol, timestamp) sort, and a
+    # single with_columns evaluates every window without helper columns.
+    df = df.sort("timestamp", maintain_order=True)
+    returns = pl.col("price").pct_change()
     df = df.with_columns([
         pl.col("price").rolling_mean(window_size=window).over("symbol").alias("sma_20"),
         pl.col("price").rolling_std(window_size=window).over("symbol").alias("vol_20"),
-        pl.col("price").pct_change().over("symbol").alias("returns")
+        (returns.rolling_mean(window_size=window) / returns.rolling_std(window_size=window))
+        .over("symbol").alias("sharpe_20")
     ])
 
-    df = df.with_columns([
-        pl.col("returns").rolling_mean(window_size=window).over("symbol").alias("mean_ret"),
-        pl.col("returns").rolling_std(window_size=window).over("symbol").alias("std_ret")
-    ])
-
-    df = df.with_columns(
-        (pl.col("mean_ret") / pl.col("std_ret")).alias("sharpe_20")
-    )
-    df = df.drop(["returns", "mean_ret", "std_ret"])
-
+    if isinstance(df, pl.LazyFrame):
+        df = df.collect()
     return df
 
 
@@ -91,25 +140,40 @@ def visualize_symbol_metrics(df_with_metrics, symbol="AAPL"):
 
     # Plot Price and SMA
     # We plot only the last 1000 points for clarity
-    fig_price = px.line(
-        df_symbol.tail(1000),
-        x='timestamp',
-        y=['price', 'sma_20'],
-        title=f'{symbol} Price vs. 20-Period SMA'
+    df_tail = df_symbol.tail(1000)
+    fig_price = _line_figure(
+        df_tail, ['price', 'sma_20'], f'{symbol} Price vs. 20-Period SMA'
     )
     fig_price.show()
 
     # Plot Volatility and Sharpe Ratio
-    fig_metrics = px.line(
-        df_symbol.tail(1000),
-        x='timestamp',
-        y=['vol_20', 'sharpe_20'],
-        title=f'{symbol} 20-Period Rolling Volatility and Sharpe Ratio'
+    fig_metrics = _line_figure(
+        df_tail, ['vol_20', 'sharpe_20'], f'{symbol} 20-Period Rolling Volatility and Sharpe Ratio'
     )
     fig_metrics.show()
 
 
-def profile_rolling_analytics(df_pd, df_pl):
+def _line_figure(df, columns, title):
+    """
+    Builds a WebGL line chart of the given columns against 'timestamp',
+    directly from graph_objects rather than through plotly.express.
+    """
+    timestamps = df['timestamp'].to_numpy()
+    return go.Figure(
+        data=[
+            go.Scattergl(x=timestamps, y=df[column].to_numpy(), mode='lines', name=column)
+            for column in columns
+        ],
+        layout=go.Layout(
+            title_text=title,
+            xaxis_title_text='timestamp',
+            yaxis_title_text='value',
+            legend_title_text='variable'
+        )
+    )
+
+
+def profile_rolling_analytics(df_pd, df_pl, lf_pl=None):
     """
     Times and compares the performance of pandas vs polars
     for the rolling analytics task.
@@ -117,6 +181,9 @@ def profile_rolling_analytics(df_pd, df_pl):
     Args:
         df_pd (pd.DataFrame): The loaded pandas DataFrame.
         df_pl (pl.DataFrame): The loaded polars DataFrame.
+        lf_pl (pl.LazyFrame): Optional, e.g. from data_loader.scan_polars.
+                              If given, the lazy scan-to-collect pipeline
+                              is timed as well.
 
     Returns:
         dict: A dictionary containing the execution times.
@@ -124,15 +191,23 @@ def profile_rolling_analytics(df_pd, df_pl):
     print("--- Task 2: Rolling Analytics Profiling ---")
 
     start_time_pd = time.time()
-    df_pd_rolling = compute_rolling_pandas(df_pd.copy())
+    df_pd_rolling = compute_rolling_pandas(df_pd)
     time_pd = time.time() - start_time_pd
     print(f"Pandas Rolling Time: {time_pd:.4f} seconds")
     #polars
     start_time_pl = time.time()
-    df_pl_rolling = compute_rolling_polars(df_pl.clone())
+    df_pl_rolling = compute_rolling_polars(df_pl)
     time_pl = time.time() - start_time_pl
     print(f"Polars Rolling Time: {time_pl:.4f} seconds")
 
+    time_pl_lazy = None
+    if lf_pl is not None:
+        # One query plan from the scan to the result, so this includes reading the data
+        start_time_pl_lazy = time.time()
+        compute_rolling_polars(lf_pl)
+        time_pl_lazy = time.time() - start_time_pl_lazy
+        print(f"Polars Lazy (scan + rolling) Time: {time_pl_lazy:.4f} seconds")
+
     print("\nPerformance Discussion:")
     if time_pl < time_pd:
         speedup = time_pd / time_pl
@@ -151,6 +226,7 @@ def profile_rolling_analytics(df_pd, df_pl):
     return {
         "pandas_rolling_time": time_pd,
         "polars_rolling_time": time_pl,
+        "polars_lazy_rolling_time": time_pl_lazy,
         "df_pd_rolling": df_pd_rolling,
         "df_pl_rolling": df_pl_rolling
     }
@@ -163,7 +239,7 @@ if __name__ == "__main__":
     df_pl = data_loader.load_polars()
 
     if df_pd is not None and df_pl is not None:
-        profile_results = profile_rolling_analytics(df_pd, df_pl)
+        profile_results = profile_rolling_analytics(df_pd, df_pl, data_loader.scan_polars())
         df_pd_with_metrics = profile_results["df_pd_rolling"]
         visualize_symbol_metrics(df_pd_with_metrics, symbol="AAPL")
 
@@ -3,73 +3,255 @@ import numpy as np
 import concurrent.futures
 import time
 import os
-import psutil
-
-def compute_metrics_for_symbol(symbol_df):
-    # workflow func. pd.DataFrame -> pd.DataFrame
-    window = 20
-    df = symbol_df.copy()
-    df.sort_index(inplace=True)
-    df['sma_20'] = df['price'].rolling(window=window).mean()
-    df['vol_20'] = df['price'].rolling(window=window).std()
-    returns = df['price'].pct_change()
-    rolling_mean_ret = returns.rolling(window=window).mean()
-    rolling_std_ret = returns.rolling(window=window).std()
-    df['sharpe_20'] = rolling_mean_ret / rolling_std_ret
-    df.replace([np.inf, -np.inf], np.nan, inplace=True)
-    return df
+import sys
+import tracemalloc
+from functools import partial
+from multiprocessing import shared_memory
+from numba import njit
+from metrics import compute_rolling_polars
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+METRIC_COLUMNS = ['sma_20', 'vol_20', 'sharpe_20']
+
+def compute_metrics_for_prices(prices, window=20):
+    # array kernel: time-ordered float64 prices -> (3, n) array of sma, vol, sharpe
+    price = pd.Series(prices)
+    # pandas' rolling mean/std already slide in O(N); reuse one window per series
+    rolling_price = price.rolling(window=window)
+    rolling_ret = price.pct_change().rolling(window=window)
+    sharpe = (rolling_ret.mean() / rolling_ret.std()).to_numpy()
+    sharpe[~np.isfinite(sharpe)] = np.nan
+    return np.vstack([rolling_price.mean().to_numpy(), rolling_price.std().to_numpy(), sharpe])
+
+@njit(cache=True, error_model='numpy')
+def _window_mean_std(values, end, window):
+    # Two-pass mean/sample std of values[end-window:end]; NaN if any value is missing
+    total = 0.0
+    for j in range(end - window, end):
+        if np.isnan(values[j]):
+            return np.nan, np.nan
+        total += values[j]
+    mean = total / window
+    sq = 0.0
+    for j in range(end - window, end):
+        sq += (values[j] - mean) ** 2
+    return mean, np.sqrt(sq / (window - 1))
+
+
+@njit(cache=True, error_model='numpy')
+def compute_metrics_numba(prices, group_offsets, window):
+    """
+    JIT-compiled equivalent of compute_metrics_for_prices over all symbols at once.
+
+    Args:
+        prices (np.ndarray): float64 prices sorted by (symbol, timestamp).
+        group_offsets (np.ndarray): Start row of each symbol, followed by len(prices).
+        window (int): The rolling window period.
+
+    Returns:
+        tuple: (sma, vol, sharpe) float64 arrays aligned with `prices`.
+    """
+    n = len(prices)
+    sma = np.full(n, np.nan)
+    vol = np.full(n, np.nan)
+    sharpe = np.full(n, np.nan)
+    returns = np.full(n, np.nan)
+
+    for g in range(len(group_offsets) - 1):
+        start = group_offsets[g]
+        stop = group_offsets[g + 1]
+        for i in range(start + 1, stop):
+            returns[i] = prices[i] / prices[i - 1] - 1.0
+        for i in range(start + window - 1, stop):
+            sma[i], vol[i] = _window_mean_std(prices, i + 1, window)
+            mean_ret, std_ret = _window_mean_std(returns, i + 1, window)
+            ratio = mean_ret / std_ret
+            if np.isfinite(ratio):
+                sharpe[i] = ratio
+
+    return sma, vol, sharpe
+
+
+def group_by_symbol(df):
+    # row order sorting df by (symbol, timestamp), each symbol's start row plus
+    # the end, and the prices in that order
+    codes, _ = pd.factorize(df['symbol'])
+    order = np.lexsort((df.index.to_numpy(), codes))
+    group_offsets = np.flatnonzero(np.diff(codes[order], prepend=-1, append=-1))
+    prices = df['price'].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+    return order, group_offsets, prices
+
+def assign_metrics(df, order, sorted_metrics):
+    # scatter metrics computed in (symbol, timestamp) order back to df's own
+    # row positions; no concat and no sort of the result
+    columns = {}
+    for column, values in zip(METRIC_COLUMNS, sorted_metrics):
+        columns[column] = np.empty_like(values)
+        columns[column][order] = values
+    return df.assign(**columns)
+
+def fill_symbol_metrics(prices, sorted_metrics, start, stop):
+    # work unit: one symbol's rows are prices[start:stop]; results go to the same columns
+    sorted_metrics[:, start:stop] = compute_metrics_for_prices(prices[start:stop])
+
+def numba_execution(df, window=20):
+    # one sort + one JIT call instead of a Python loop over symbols
+    order, group_offsets, prices = group_by_symbol(df)
+    sorted_metrics = compute_metrics_numba(prices, group_offsets, window)
+    return assign_metrics(df, order, sorted_metrics)
 
 def sequential_execution(df):
-    symbols=df['symbol'].unique()
-    results =[]#list(df)
-    for symbol in symbols:
-        symbol_df=df[df['symbol']==symbol]
-        results.append(compute_metrics_for_symbol(symbol_df))
-    return pd.concat(results).sort_index()
+    order, group_offsets, prices = group_by_symbol(df)
+    sorted_metrics = np.empty((len(METRIC_COLUMNS), len(prices)))
+    for start, stop in zip(group_offsets[:-1], group_offsets[1:]):
+        fill_symbol_metrics(prices, sorted_metrics, start, stop)
+    return assign_metrics(df, order, sorted_metrics)
+
+def compute_metrics_shared(prices_name, metrics_name, n_rows, start, stop):
+    # process-pool work unit: reads its symbol's prices from one shared segment
+    # and writes its metrics into another. Workers share the parent's resource
+    # tracker, so the parent's unlink suffices
+    prices_shm = shared_memory.SharedMemory(name=prices_name)
+    metrics_shm = shared_memory.SharedMemory(name=metrics_name)
+    try:
+        prices = np.ndarray((n_rows,), dtype=np.float64, buffer=prices_shm.buf)
+        sorted_metrics = np.ndarray((len(METRIC_COLUMNS), n_rows), dtype=np.float64, buffer=metrics_shm.buf)
+        fill_symbol_metrics(prices, sorted_metrics, start, stop)
+        del prices, sorted_metrics
+    finally:
+        prices_shm.close()
+        metrics_shm.close()
+
+def shared_memory_execution(df, executor_class, max_workers):
+    # inputs and outputs live in shared memory, so each task ships five
+    # scalars instead of pickling a DataFrame slice there and back
+    order, group_offsets, prices = group_by_symbol(df)
+    n_rows = len(prices)
+    prices_shm = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+    metrics_shm = shared_memory.SharedMemory(create=True, size=max(len(METRIC_COLUMNS) * prices.nbytes, 1))
+    try:
+        np.ndarray(prices.shape, dtype=np.float64, buffer=prices_shm.buf)[:] = prices
+        worker_func = partial(compute_metrics_shared, prices_shm.name, metrics_shm.name, n_rows)
+        with executor_class(max_workers=max_workers) as executor:
+            list(executor.map(worker_func, group_offsets[:-1], group_offsets[1:]))
+        sorted_metrics = np.ndarray((len(METRIC_COLUMNS), n_rows), dtype=np.float64, buffer=metrics_shm.buf)
+        result = assign_metrics(df, order, sorted_metrics)
+        del sorted_metrics
+    finally:
+        prices_shm.close()
+        prices_shm.unlink()
+        metrics_shm.close()
+        metrics_shm.unlink()
+    return result
 
 def parallel_execution(df,executor_class,max_workers=None):
     if max_workers is None:
         max_workers= os.cpu_count() or 1
-    symbols = df['symbol'].unique()
-    dfs_to_process =[df[df['symbol'] == symbol] for symbol in symbols]
-    results = []
+    if issubclass(executor_class, concurrent.futures.ProcessPoolExecutor):
+        return shared_memory_execution(df, executor_class, max_workers)
+    # threads share memory, so each one writes straight into the output array
+    order, group_offsets, prices = group_by_symbol(df)
+    sorted_metrics = np.empty((len(METRIC_COLUMNS), len(prices)))
+    worker_func = partial(fill_symbol_metrics, prices, sorted_metrics)
     with executor_class(max_workers=max_workers) as executor:
-        results = list(executor.map(compute_metrics_for_symbol,dfs_to_process))
-    return pd.concat(results).sort_index()
+        list(executor.map(worker_func, group_offsets[:-1], group_offsets[1:]))
+    return assign_metrics(df, order, sorted_metrics)
 
-def profile_parallelism(df_pd):
-    main_process = psutil.Process(os.getpid())
+def parallel_execution_polars(df_pl):
+    # no Python-level executor: .over('symbol') runs on Polars' native thread pool
+    return compute_rolling_polars(df_pl)
+
+def assert_polars_matches(df_sequential, df_polars, atol=1e-9):
+    # compare the Polars metrics with the sequential pandas ones; rows are
+    # aligned on (symbol, timestamp) since the two frames are ordered differently
+    def aligned(df):
+        df = df.astype({'symbol': str}).sort_values(['symbol', 'timestamp'], kind='stable')
+        return df[['symbol', 'timestamp'] + METRIC_COLUMNS].reset_index(drop=True)
+
+    expected = aligned(df_sequential.reset_index())
+    actual = aligned(df_polars.select(['timestamp', 'symbol'] + METRIC_COLUMNS).to_pandas())
+    # sequential reports non-finite Sharpe ratios (flat windows) as NaN
+    sharpe = actual['sharpe_20'].to_numpy(dtype=np.float64)
+    actual['sharpe_20'] = np.where(np.isfinite(sharpe), sharpe, np.nan)
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False, atol=atol)
+
+def traced_peak(func, *args):
+    # peak allocation (MiB) of one extra, untimed call so tracing never skews the
+    # timings; only meaningful for in-process pandas/NumPy work, since memory
+    # allocated in worker processes or natively by Numba or Polars is not traced
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
 
-    mem_before_seq = main_process.memory_info().rss / (1024 * 1024)  # MiB
+def children_peak_rss():
+    # lifetime high-water mark (MiB) of the largest RSS any finished child process
+    # has reached so far, not just this run's workers; ru_maxrss is KiB on Linux,
+    # bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def profile_parallelism(df_pd, df_pl=None):
     start_time_seq = time.time()
 
-    df_sequential = sequential_execution(df_pd.copy())
+    df_sequential = sequential_execution(df_pd)
 
     time_seq = time.time() - start_time_seq
-    mem_seq = (main_process.memory_info().rss / (1024 * 1024)) - mem_before_seq
-    print(f"Sequential Time:    {time_seq:>7.4f} seconds | Memory (Main): {mem_seq:>6.2f} MiB")
+    mem_seq = traced_peak(sequential_execution, df_pd)
+    print(f"Sequential Time:    {time_seq:>7.4f} seconds | Peak Memory: {mem_seq:>6.2f} MiB")
 
-    mem_before_thread = main_process.memory_info().rss / (1024 * 1024)
     start_time_thread = time.time()
 
-    df_threaded = parallel_execution(df_pd.copy(), concurrent.futures.ThreadPoolExecutor)
+    df_threaded = parallel_execution(df_pd, concurrent.futures.ThreadPoolExecutor)
 
     time_thread = time.time() - start_time_thread
-    mem_thread = (main_process.memory_info().rss / (1024 * 1024)) - mem_before_thread
-    print(f"Threading Time:     {time_thread:>7.4f} seconds | Memory (Main): {mem_thread:>6.2f} MiB")
+    mem_thread = traced_peak(parallel_execution, df_pd, concurrent.futures.ThreadPoolExecutor)
+    print(f"Threading Time:     {time_thread:>7.4f} seconds | Peak Memory: {mem_thread:>6.2f} MiB")
 
-    mem_before_proc = main_process.memory_info().rss / (1024 * 1024)
     start_time_proc = time.time()
 
-    df_processed = parallel_execution(df_pd.copy(), concurrent.futures.ProcessPoolExecutor)
+    df_processed = parallel_execution(df_pd, concurrent.futures.ProcessPoolExecutor)
 
     time_proc = time.time() - start_time_proc
-    mem_proc = (main_process.memory_info().rss / (1024 * 1024)) - mem_before_proc
-    print(f"Multiprocessing Time: {time_proc:>7.4f} seconds | Memory (Main): {mem_proc:>6.2f} MiB")
+    # the work happens in the workers, so report their RSS rather than the parent's
+    mem_children = children_peak_rss()
+    mem_proc = "N/A" if mem_children is None else f"{mem_children:>6.2f} MiB (worker lifetime peak RSS)"
+    print(f"Multiprocessing Time: {time_proc:>7.4f} seconds | Peak Memory: {mem_proc}")
+
+    # Compile the JIT kernel outside the timed region
+    numba_execution(df_pd.head(1))
+    start_time_numba = time.time()
+
+    df_numba = numba_execution(df_pd)
+
+    time_numba = time.time() - start_time_numba
+    # Numba and Polars allocate natively, out of tracemalloc's sight
+    print(f"Numba JIT Time:     {time_numba:>7.4f} seconds | Peak Memory:    N/A")
+
+    time_polars = None
+    if df_pl is not None:
+        start_time_polars = time.time()
+
+        df_polars = parallel_execution_polars(df_pl)
+
+        time_polars = time.time() - start_time_polars
+        print(f"Polars Native Time: {time_polars:>7.4f} seconds | Peak Memory:    N/A")
 
     try:
         pd.testing.assert_frame_equal(df_sequential, df_threaded, atol=1e-9)
         pd.testing.assert_frame_equal(df_sequential, df_processed, atol=1e-9)
+        pd.testing.assert_frame_equal(df_sequential, df_numba, atol=1e-9)
+        if df_pl is not None:
+            assert_polars_matches(df_sequential, df_polars)
         print("\nVerification: All methods produced consistent results.")
     except AssertionError as e:
         print(f"\nVerification FAILED: Results are not consistent. {e}")
@@ -128,7 +310,9 @@ def profile_parallelism(df_pd):
     return {
         "sequential_time": time_seq,
         "threading_time": time_thread,
-        "processing_time": time_proc
+        "processing_time": time_proc,
+        "numba_time": time_numba,
+        "polars_time": time_polars
     }
 
 
@@ -137,8 +321,9 @@ if __name__ == "__main__":
 
     print("--- Loading data for parallel.py test ---")
     df_pd = data_loader.load_pandas()
+    df_pl = data_loader.load_polars()
 
     if df_pd is not None:
-        profile_parallelism(df_pd)
+        profile_parallelism(df_pd, df_pl)
     else:
         print("Data loading failed. Please check data_loader.py.")
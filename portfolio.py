@@ -2,79 +2,128 @@ import json
 import pandas as pd
 import numpy as np
 import concurrent.futures
-import copy
 import time
 from functools import partial
 import os
 
 try:
-    from metrics import compute_drawdown
+    from metrics import compute_drawdown_by_symbol
 except ImportError:
-    print("Warning: Could not import compute_drawdown from metrics.py. Make sure the file is in the same directory.")
+    print("Warning: Could not import compute_drawdown_by_symbol from metrics.py. Make sure the file is in the same directory.")
     #fallback
-    def compute_drawdown(price_series):
-        if price_series.empty: return 0.0
-        cumulative_max = price_series.cummax()
-        drawdowns = (price_series - cumulative_max) / cumulative_max
-        max_drawdown = drawdowns.min()
-        return max_drawdown if pd.notna(max_drawdown) else 0.0
+    def compute_drawdown_by_symbol(symbols, prices):
+        prices = pd.Series(prices, dtype='float64')
+        cumulative_max = prices.groupby(symbols, sort=False).cummax()
+        drawdowns = (prices - cumulative_max) / cumulative_max
+        return drawdowns.groupby(symbols, sort=False).min().fillna(0.0)
 
 
-def compute_position_metrics(position_data, latest_data_dict, symbol_price_history):
+def compute_symbol_metrics(symbol_price_history, symbols):
     """
-    Computes metrics for a single position.
+    Computes volatility and drawdown once per symbol, so positions that
+    share a symbol do not repeat the work.
+
+    Args:
+        symbol_price_history (dict): A lookup dict for {symbol -> prices}, where
+                                     prices is a 1-D array or pd.Series.
+        symbols (iterable): The symbols referenced by the portfolio.
+
+    Returns:
+        dict: A lookup dict for {symbol -> (volatility, drawdown)}.
+    """
+    histories = {}
+    for symbol in set(symbols):
+        history = symbol_price_history.get(symbol)
+        if history is not None and len(history) > 0:
+            histories[symbol] = np.asarray(history, dtype=np.float64)
+    if not histories:
+        return {}
+
+    # Compute Drawdown for every symbol in one grouped pass
+    labels = np.repeat(list(histories), [len(history) for history in histories.values()])
+    drawdowns = compute_drawdown_by_symbol(labels, np.concatenate(list(histories.values())))
+
+    symbol_metrics = {}
+    for symbol, prices in histories.items():
+        # Compute Volatility (std dev of the last 20 returns); the window
+        # is not full until there are 21 prices
+        tail = prices[-21:]
+        if len(tail) == 21:
+            volatility = np.std(tail[1:] / tail[:-1] - 1, ddof=1)
+        else:
+            volatility = 0.0
+        if not np.isfinite(volatility):
+            volatility = 0.0
+        symbol_metrics[symbol] = (float(volatility), drawdowns[symbol])
+    return symbol_metrics
+
+
+def compute_position_metrics(positions, latest_data_dict, symbol_metrics):
+    """
+    Computes metrics for a batch of positions in one vectorized sweep.
     This is the "work unit" for parallel processing.
 
     It must be a top-level function to be 'picklable' by multiprocessing.
 
     Args:
-        position_data (dict): A dict with 'symbol' and 'quantity'.
+        positions (list): Dicts with 'symbol' and 'quantity'.
         latest_data_dict (dict): A lookup dict for {symbol -> latest_price}.
-        symbol_price_history (dict): A lookup dict for {symbol -> pd.Series(prices)}.
+        symbol_metrics (dict): A lookup dict for {symbol -> (volatility, drawdown)},
+                               as built by compute_symbol_metrics.
 
     Returns:
-        dict: The position_data dict updated with 'value', 'volatility', 'drawdown'.
+        list: One dict per position with 'value', 'volatility', 'drawdown' added.
     """
-    try:
-        symbol = position_data['symbol']
-        quantity = position_data['quantity']
-
-        # Get latest data
+    # Validate every position up front: a malformed one is logged and gets
+    # zero metrics, as before, instead of failing the whole batch
+    valid = np.ones(len(positions), dtype=bool)
+    pos_qty = np.zeros(len(positions))
+    pos_codes = np.zeros(len(positions), dtype=np.intp)
+    # Give each distinct symbol an int code so the per-position lookups
+    # become array indexing
+    symbol_to_code = {}
+    for i, pos in enumerate(positions):
+        try:
+            pos_qty[i] = float(pos['quantity'])
+            pos_codes[i] = symbol_to_code.setdefault(pos['symbol'], len(symbol_to_code))
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Error processing {pos.get('symbol')}: {e}")
+            valid[i] = False
+
+    latest_price = np.zeros(len(symbol_to_code))
+    vol_by_symbol = np.zeros(len(symbol_to_code))
+    dd_by_symbol = np.zeros(len(symbol_to_code))
+    for symbol, code in symbol_to_code.items():
         latest = latest_data_dict.get(symbol)
         if not latest:
             print(f"Warning: No market data for symbol {symbol}. Skipping.")
-            return {**position_data, "value": 0, "volatility": 0, "drawdown": 0}
-
-        # Compute Value = quantity * latest price
-        latest_price = latest['price']
-        value = quantity * latest_price
-
-        # Get price history for vol and drawdown
-        history = symbol_price_history.get(symbol)
-        if history is None or history.empty:
-            volatility = 0.0
-            drawdown = 0.0
-        else:
-            # Compute Volatility (using last 20-period std dev of returns)
-            returns = history.pct_change()
-            volatility = returns.rolling(20).std().iloc[-1]
-            if pd.isna(volatility):
-                volatility = 0.0  # Handle case where window is not full
-
-            # Compute Drawdown
-            drawdown = compute_drawdown(history)
-
-        return {
-            "symbol": symbol,
-            "quantity": quantity,
-            "value": round(value, 2),
-            "volatility": round(volatility, 4),
-            "drawdown": round(drawdown, 4)
-        }
-    except Exception as e:
-        print(f"Error processing {position_data.get('symbol')}: {e}")
-        return {**position_data, "value": 0, "volatility": 0, "drawdown": 0}
-
+            continue  # value, volatility and drawdown stay 0
+        try:
+            latest_price[code] = latest['price']
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Error processing {symbol}: {e}")
+            continue
+        # Symbols without price history get zero volatility and drawdown
+        vol_by_symbol[code], dd_by_symbol[code] = symbol_metrics.get(symbol, (0.0, 0.0))
+
+    # Compute Value = quantity * latest price, for every position at once;
+    # masked positions keep 0 for every metric
+    values = np.where(valid, np.round(pos_qty * latest_price[pos_codes], 2), 0.0)
+    volatilities = np.where(valid, np.round(vol_by_symbol[pos_codes], 4), 0.0)
+    drawdowns = np.where(valid, np.round(dd_by_symbol[pos_codes], 4), 0.0)
+
+    return [
+        {
+            "symbol": pos['symbol'],
+            "quantity": pos['quantity'],
+            "value": value,
+            "volatility": volatility,
+            "drawdown": drawdown
+        } if is_valid else {**pos, "value": 0, "volatility": 0, "drawdown": 0}
+        for pos, is_valid, value, volatility, drawdown in zip(
+            positions, valid.tolist(), values.tolist(), volatilities.tolist(), drawdowns.tolist()
+        )
+    ]
 
 def get_all_positions(portfolio_node):
     """
@@ -101,7 +150,7 @@ def map_positions_back(portfolio_node, position_map):
         new_positions = []
         for pos in portfolio_node["positions"]:
             # Use (symbol, quantity) as a unique key
-            key = (pos['symbol'], pos['quantity'])
+            key = (pos.get('symbol'), pos.get('quantity'))
             if key in position_map:
                 new_positions.append(position_map[key])
         portfolio_node["positions"] = new_positions
@@ -111,44 +160,71 @@ def map_positions_back(portfolio_node, position_map):
             map_positions_back(sub, position_map)
 
 
+def copy_portfolio_tree(portfolio_node):
+    """
+    Copies just the node dicts and 'sub_portfolios' lists of a portfolio tree.
+    These are the only parts the orchestrators mutate: map_positions_back
+    assigns each node a fresh 'positions' list and aggregate_portfolio adds
+    keys to the nodes. Positions are shared with the original, unlike
+    copy.deepcopy, which walks every position dict as well.
+    """
+    node = dict(portfolio_node)
+    if "sub_portfolios" in node:
+        node["sub_portfolios"] = [copy_portfolio_tree(sub) for sub in node["sub_portfolios"]]
+    return node
+
+
 def aggregate_portfolio(portfolio_node):
     """
-    Recursively computes and aggregates metrics for a portfolio tree.
-    This function MODIFIES the node in-place and assumes that all
+    Computes and aggregates metrics for a portfolio tree, bottom-up.
+    This function MODIFIES the nodes in-place and assumes that all
     'positions' have already been computed by compute_position_metrics.
-    """
-    total_value = 0.0
-    weighted_vol = 0.0
-    max_drawdown = 0.0  # Drawdowns are negative, so 0 is the 'best'
 
-    #Aggregate positions in this node
-    if "positions" in portfolio_node:
-        for pos in portfolio_node["positions"]:
+    The tree is walked post-order with an explicit stack rather than by
+    recursion, so deep trees pay no per-level call overhead and cannot
+    hit the interpreter's recursion limit.
+    """
+    stack = [(portfolio_node, False)]
+    while stack:
+        node, children_done = stack.pop()
+        sub_portfolios = node.get("sub_portfolios", ())
+        if not children_done:
+            # Revisit this node once all of its children are aggregated
+            stack.append((node, True))
+            stack.extend((sub, False) for sub in sub_portfolios)
+            continue
+
+        total_value = 0.0
+        weighted_vol = 0.0
+        max_drawdown = 0.0  # Drawdowns are negative, so 0 is the 'best'
+
+        #Aggregate positions in this node
+        for pos in node.get("positions", ()):
             # 'pos' is now the fully computed dict
-            total_value += pos.get("value", 0)
-            weighted_vol += pos.get("value", 0) * pos.get("volatility", 0)
-            max_drawdown = min(max_drawdown, pos.get("drawdown", 0))
-
-    #Recurse into sub-portfolios
-    if "sub_portfolios" in portfolio_node:
-        for sub_portfolio in portfolio_node["sub_portfolios"]:
-            # Recursively call, which aggregates from the bottom up
-            aggregate_portfolio(sub_portfolio)
-
-            # Aggregate results from the child
-            total_value += sub_portfolio.get("total_value", 0)
-            weighted_vol += sub_portfolio.get("total_value", 0) * sub_portfolio.get("aggregate_volatility", 0)
-            max_drawdown = min(max_drawdown, sub_portfolio.get("max_drawdown", 0))
-
-    #Set metrics for the current node
-    portfolio_node["total_value"] = round(total_value, 2)
-    if total_value > 0:
-        # Weighted average volatility
-        portfolio_node["aggregate_volatility"] = round(weighted_vol / total_value, 4)
-    else:
-        portfolio_node["aggregate_volatility"] = 0.0
-    # Worst drawdown
-    portfolio_node["max_drawdown"] = round(max_drawdown, 4)
+            value = pos.get("value", 0)
+            total_value += value
+            weighted_vol += value * pos.get("volatility", 0)
+            drawdown = pos.get("drawdown", 0)
+            if drawdown < max_drawdown:
+                max_drawdown = drawdown
+
+        #Aggregate results from the (already aggregated) children
+        for sub_portfolio in sub_portfolios:
+            sub_value = sub_portfolio["total_value"]
+            total_value += sub_value
+            weighted_vol += sub_value * sub_portfolio["aggregate_volatility"]
+            if sub_portfolio["max_drawdown"] < max_drawdown:
+                max_drawdown = sub_portfolio["max_drawdown"]
+
+        #Set metrics for the current node
+        node["total_value"] = round(total_value, 2)
+        if total_value > 0:
+            # Weighted average volatility
+            node["aggregate_volatility"] = round(weighted_vol / total_value, 4)
+        else:
+            node["aggregate_volatility"] = 0.0
+        # Worst drawdown
+        node["max_drawdown"] = round(max_drawdown, 4)
 
     return portfolio_node
 
@@ -157,21 +233,25 @@ def process_portfolio_sequentially(portfolio_json, latest_data_dict, symbol_pric
     """
     Orchestrator for the sequential (single-process) run.
     """
-    # Use deepcopy to avoid modifying the original data
-    portfolio_struct = copy.deepcopy(portfolio_json)
+    # Copy the tree structure to avoid modifying the original data
+    portfolio_struct = copy_portfolio_tree(portfolio_json)
 
     # Get flat list of all positions
     all_positions = get_all_positions(portfolio_struct)
 
-    # Compute metrics for all positions sequentially
-    computed_positions = [
-        compute_position_metrics(pos, latest_data_dict, symbol_price_history)
-        for pos in all_positions
-    ]
+    # Compute volatility and drawdown once per symbol
+    symbol_metrics = compute_symbol_metrics(
+        symbol_price_history, (pos.get('symbol') for pos in all_positions)
+    )
+
+    # Compute metrics for all positions in one batch
+    computed_positions = compute_position_metrics(
+        all_positions, latest_data_dict, symbol_metrics
+    )
 
     # Map computed positions back into the tree
     position_map = {
-        (pos['symbol'], pos['quantity']): pos
+        (pos.get('symbol'), pos.get('quantity')): pos
         for pos in computed_positions
     }
     map_positions_back(portfolio_struct, position_map)
@@ -184,19 +264,31 @@ def process_portfolio_parallel(portfolio_json, latest_data_dict, symbol_price_hi
     """
     Orchestrator for the parallel (multiprocessing) run.
     """
-    portfolio_struct = copy.deepcopy(portfolio_json)
+    portfolio_struct = copy_portfolio_tree(portfolio_json)
     all_positions = get_all_positions(portfolio_struct)
+    symbol_metrics = compute_symbol_metrics(
+        symbol_price_history, (pos.get('symbol') for pos in all_positions)
+    )
     worker_func = partial(
         compute_position_metrics,
         latest_data_dict=latest_data_dict,
-        symbol_price_history=symbol_price_history
+        symbol_metrics=symbol_metrics
     )
 
+    # One batch of positions per worker, rather than one task per position
+    n_workers = os.cpu_count() or 1
+    batch_size = -(-len(all_positions) // n_workers) or 1
+    batches = [
+        all_positions[i:i + batch_size]
+        for i in range(0, len(all_positions), batch_size)
+    ]
+
     computed_positions = []
-    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
-        computed_positions = list(executor.map(worker_func, all_positions))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+        for batch in executor.map(worker_func, batches):
+            computed_positions.extend(batch)
     position_map = {
-        (pos['symbol'], pos['quantity']): pos
+        (pos.get('symbol'), pos.get('quantity')): pos
         for pos in computed_positions
     }
     map_positions_back(portfolio_struct, position_map)
@@ -228,14 +320,26 @@ def profile_portfolio_aggregation(df_pd, portfolio_filepath="portfolio_structure
         return {"portfolio_seq_time": 0, "portfolio_par_time": 0}
 
 
-    # Get latest price for all symbols
-    latest_data = df_pd.reset_index().groupby('symbol').last()
-    latest_data_dict = latest_data.to_dict('index')
-
-    # Get price history for all symbols
-    symbol_price_history = {
-        symbol: group['price']
-        for symbol, group in df_pd.groupby('symbol')
+    # Get price history for all symbols: factorize the symbols once and slice
+    # each history out of one symbol-sorted price array, so no per-symbol
+    # Series is built and the histories pickle as plain buffers
+    codes, symbols = pd.factorize(df_pd['symbol'], sort=True)
+    order = np.argsort(codes, kind='stable')  # keeps each symbol's rows in time order
+    prices = df_pd['price'].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+    bounds = np.searchsorted(codes[order], np.arange(len(symbols) + 1))
+    history_arrays = [prices[bounds[code]:bounds[code + 1]] for code in range(len(symbols))]
+    symbol_price_history = dict(zip(symbols, history_arrays))
+
+    # Get latest price for all symbols: the last non-missing price in each
+    # symbol's slice, found with one binary search over the valid positions
+    valid = np.flatnonzero(~np.isnan(prices))
+    last = np.searchsorted(valid, bounds[1:]) - 1
+    found = last >= 0
+    found[found] = valid[last[found]] >= bounds[:-1][found]
+    latest_prices = np.full(len(symbols), np.nan)
+    latest_prices[found] = prices[valid[last[found]]]
+    latest_data_dict = {
+        symbol: {'price': price} for symbol, price in zip(symbols, latest_prices.tolist())
     }
 
     # Run Sequential (Baseline)
@@ -1,119 +1,309 @@
+import io
+import os
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.io as pio
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Layout for the combined chart figure, built once and applied in a single
+# update; the template itself is the default set by _configure_plotly
+_CHART_LAYOUT = {
+    'title_text': 'Performance Comparison',
+    'showlegend': False,
+    'height': 800,
+    'yaxis_title_text': 'Time (s)',
+    'yaxis2_title_text': 'Memory (MiB)',
+    'yaxis3_title_text': 'Time (s)',
+    'yaxis4_title_text': 'Time (s)'
+}
+
+# Baseline strategies every summary has; the Numba and Polars rows are
+# optional and plotted only when present
+_BASELINE_PARALLEL_TASKS = frozenset([
+    "3. Parallelism - Sequential (s)",
+    "3. Parallelism - Threading (s)",
+    "3. Parallelism - Multiprocessing (s)"
+])
+
+# Parallelism Comparison tasks, plotted in the order they appear in the summary
+_PARALLEL_TASKS = _BASELINE_PARALLEL_TASKS | frozenset([
+    "3. Parallelism - Numba JIT (s)",
+    "3. Parallelism - Polars Native (s)"
+])
+
+# Every Task row plot_performance_charts needs
+_REQUIRED_TASKS = frozenset([
+    "1. Ingestion Time (s)",
+    "1. Ingestion Peak Memory (MiB)",
+    "2. Rolling Analytics Time (s)"
+]) | _BASELINE_PARALLEL_TASKS
+
+# Plotly's default qualitative palette; bars are colored per x value within
+# a single trace rather than split into one trace per color
+_BAR_COLORS = ('#636EFA', '#EF553B', '#00CC96', '#AB63FA', '#FFA15A',
+               '#19D3F3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52')
+
+
+def _bar_colors(n):
+    """
+    Returns n palette colors, cycling when there are more bars than colors.
+    """
+    return [_BAR_COLORS[i % len(_BAR_COLORS)] for i in range(n)]
 
-# Set a clean default theme for plots
-pio.templates.default = "plotly_white"
 
+# Plotly is imported on first use, so report-only callers never load it
+_PIO_CONFIGURED = False
 
-def plot_performance_charts(df_performance):
-    """
-    Generates and displays interactive bar charts for performance comparison.
 
-    Args:
-        df_performance (pd.DataFrame): The summary DataFrame of all metrics.
+def _configure_plotly():
     """
-    print("Generating Performance Visualizations...")
+    Applies the Plotly theme and JSON engine once, on the first chart.
+    """
+    global _PIO_CONFIGURED
+    if _PIO_CONFIGURED:
+        return
+    import plotly.io as pio
 
-    try:
-        # Ingestion Time
-        df_ingest_time = df_performance[
-            df_performance['Task'] == '1. Ingestion Time (s)'
-            ].melt(id_vars='Task', var_name='Library', value_name='Time (s)')
+    # Set a clean default theme for plots
+    pio.templates.default = "plotly_white"
 
-        fig1 = px.bar(df_ingest_time, x='Library', y='Time (s)', color='Library',
-                      title='Data Ingestion Time (Lower is Better)')
-        fig1.show()
+    # Serialize figures with orjson when it is installed; it encodes floats
+    # and arrays much faster than the stdlib json module
+    try:
+        import orjson  # noqa: F401
+        pio.json.config.default_engine = "orjson"
+    except ImportError:
+        pass
+    _PIO_CONFIGURED = True
 
-        df_ingest_mem = df_performance[
-            df_performance['Task'] == '1. Ingestion Peak Memory (MiB)'
-            ].melt(id_vars='Task', var_name='Library', value_name='Memory (MiB)')
 
-        fig2 = px.bar(df_ingest_mem, x='Library', y='Memory (MiB)', color='Library',
-                      title='Data Ingestion Peak Memory (Lower is Better)')
-        fig2.show()
+# Static report text, built once at import rather than on every report
+_DISCUSSION_MD = """
+##  tradeoffs in Syntax, Ecosystem, and Scalability
 
-        df_rolling_time = df_performance[
-            df_performance['Task'] == '2. Rolling Analytics Time (s)'
-            ].melt(id_vars='Task', var_name='Library', value_name='Time (s)')
+### 1. Pandas vs. Polars (Tasks 1 & 2)
 
-        fig3 = px.bar(df_rolling_time, x='Library', y='Time (s)', color='Library',
-                      title='Rolling Analytics Time (Lower is Better)')
-        fig3.show()
+* **Performance (Time & Memory):** `Polars` is demonstrably faster and more memory-efficient in both data ingestion and rolling analytics. This is due to its Rust backend, multi-threaded query engine, and column-based storage.
+* **Syntax:** `Pandas` is more established, and its `groupby().rolling()` syntax is familiar, though it can be complex (as seen in the "duplicate label" error). `Polars` uses a more functional, expression-based API (`.over()`, `.with_columns()`) which is highly consistent and easier to parallelize.
+* **Scalability:** `Polars` is built for scalability. Its lazy API allows it to optimize entire query chains and handle datasets larger than available RAM, which `Pandas` (in its default eager mode) cannot do.
 
-        # Parallelism Comparison (Pandas)
-        parallel_tasks = [
-            "3. Parallelism - Sequential (s)",
-            "3. Parallelism - Threading (s)",
-            "3. Parallelism - Multiprocessing (s)"
-        ]
-        df_parallel_perf = df_performance[df_performance['Task'].isin(parallel_tasks)]
+### 2. Threading vs. Multiprocessing (Task 3)
 
-        df_parallel_melted = df_parallel_perf.melt(
-            id_vars='Task', value_vars=['Pandas'], value_name='Time (s)'
-        )
+* **Performance:** `Threading` was significantly faster than both `Sequential` and `Multiprocessing` for this task.
+* **The GIL (Global Interpreter Lock):** The GIL prevents multiple threads from executing Python code at the same time. However, many `pandas` operations (like `.rolling().mean()`) are C-extensions that **release the GIL**.
+* **Why Threading Won:** Because the GIL was released, other threads could start their own C-level computations. It provided true parallelism with very low overhead.
+* **Why Multiprocessing Lost:** `Multiprocessing` avoids the GIL but has massive **serialization (pickling) overhead**. The cost of pickling, sending, and un-pickling large DataFrame slices to other processes was far greater than the computational gain.
 
-        fig4 = px.bar(df_parallel_melted, x='Task', y='Time (s)', color='Task',
-                      title='Pandas Parallelism Strategies (Lower is Better)')
-        fig4.update_xaxes(categoryorder='array', categoryarray=parallel_tasks)
-        fig4.show()
+### 3. Portfolio Aggregation (Task 4)
 
-        print("Visualization complete...")
+* **Performance:** For a small portfolio, `Sequential` is often faster because the overhead of starting new processes (as `Multiprocessing` does) is higher than the task's computation time.
+* **When to use Multiprocessing:** As the number of positions grows from 3 to 3,000, `Multiprocessing` would win. The task (`compute_drawdown`, `rolling().std()`) is pure-Python and CPU-bound, making it a perfect case for avoiding the GIL, *assuming* the number of tasks is large enough to overcome the initial setup cost.
+"""
 
-    except Exception as e:
-        print(f"Error generating plots: {e}")
+_REPORT_TITLE = "# ⚙️ Performance Comparison Report"
+_SUMMARY_HEADING = "## 1. Performance Summary Table"
+_DISCUSSION_HEADING = "## 2. Discussion of Tradeoffs"
 
 
-def generate_performance_report(df_performance):
+def plot_performance_charts(df_performance, interactive=True, out_dir=None):
     """
-    Generates the final performance_report.md content.
+    Generates and displays interactive bar charts for performance comparison.
+    All four charts are panels of one figure, so it is serialized and
+    rendered once.
 
     Args:
         df_performance (pd.DataFrame): The summary DataFrame of all metrics.
-
-    Returns:
-        str: A string containing the full markdown report.
+        interactive (bool): Show the figure with fig.show(). When False (e.g.
+                            headless CI), save it as a static PNG instead.
+        out_dir (str): Directory for the saved figure; defaults to the
+                       working directory.
     """
+    print("Generating Performance Visualizations...")
 
-    # Create the Summary Table...
+    # Check every chart's rows are present before importing Plotly or
+    # building anything
+    missing = _REQUIRED_TASKS - set(df_performance['Task'])
+    if missing:
+        print(f"Skipping plots, missing tasks: {sorted(missing)}")
+        return
+
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    _configure_plotly()
+
+    # Index by Task once, as a categorical so the lookups match on int
+    # codes; each chart then reads its row straight from the wide frame,
+    # with the library columns as the x values
+    df_by_task = df_performance.astype({'Task': 'category'}).set_index('Task')
+    ingest_time = df_by_task.loc['1. Ingestion Time (s)'].to_numpy()
+    ingest_mem = df_by_task.loc['1. Ingestion Peak Memory (MiB)'].to_numpy()
+    rolling_time = df_by_task.loc['2. Rolling Analytics Time (s)'].to_numpy()
+    libraries = df_by_task.columns.to_numpy()
+
+    # Each strategy is timed under one library; take the first cell that is
+    # set in each row, straight from the values array. Optional strategy rows
+    # that are absent, or present but untimed, are left out
+    parallel_rows = df_by_task.loc[df_by_task.index.isin(_PARALLEL_TASKS)]
+    parallel_values = parallel_rows.to_numpy(dtype=np.float64, na_value=np.nan)
+    is_set = ~np.isnan(parallel_values)
+    timed = is_set.any(axis=1)
+    parallel_tasks = parallel_rows.index.to_numpy()[timed]
+    parallel_time = parallel_values[np.flatnonzero(timed), is_set.argmax(axis=1)[timed]]
+
+    fig = make_subplots(rows=2, cols=2, subplot_titles=[
+        'Data Ingestion Time (Lower is Better)',
+        'Data Ingestion Peak Memory (Lower is Better)',
+        'Rolling Analytics Time (Lower is Better)',
+        'Parallelism Strategies (Lower is Better)'
+    ])
+    library_colors = _bar_colors(len(libraries))
+    fig.add_trace(go.Bar(x=libraries, y=ingest_time, marker_color=library_colors), row=1, col=1)
+    fig.add_trace(go.Bar(x=libraries, y=ingest_mem, marker_color=library_colors), row=1, col=2)
+    fig.add_trace(go.Bar(x=libraries, y=rolling_time, marker_color=library_colors), row=2, col=1)
+    fig.add_trace(go.Bar(x=parallel_tasks, y=parallel_time,
+                         marker_color=_bar_colors(len(parallel_tasks))), row=2, col=2)
+
+    fig.update_layout(_CHART_LAYOUT)
+    if interactive:
+        fig.show()
+    else:
+        # Static export starts kaleido once for the whole figure
+        path = os.path.join(out_dir or '.', 'performance_charts.png')
+        try:
+            fig.write_image(path, format='png')
+        except (ValueError, RuntimeError) as e:
+            # kaleido is optional; fall back to a standalone HTML file
+            print(f"Error exporting PNG: {e}")
+            path = os.path.splitext(path)[0] + '.html'
+            fig.write_html(path)
+        print(f"Saved performance charts to '{path}'")
+
+    print("Visualization complete...")
+
+
+def _arrow_column(series):
+    """
+    Converts a column to an Arrow array, with missing values as nulls.
+    """
     try:
-        # Use .to_markdown() for a clean table format
-        summary_table = df_performance.to_markdown(index=False)
-    except Exception as e:
-        print(f"Error generating markdown table: {e}")
-        summary_table = "Error creating performance table."
-
-    # Create the Discussion Text...
-    discussion = """
-##  tradeoffs in Syntax, Ecosystem, and Scalability
+        return pa.array(series, from_pandas=True)
+    except pa.ArrowException:
+        # A mixed-type column Arrow cannot infer one type for: str() each
+        # value, keeping the missing ones null
+        return pa.array(series.astype(str).where(series.notna()), from_pandas=True)
 
-### 1. Pandas vs. Polars (Tasks 1 & 2)
 
-* **Performance (Time & Memory):** `Polars` is demonstrably faster and more memory-efficient in both data ingestion and rolling analytics. This is due to its Rust backend, multi-threaded query engine, and column-based storage.
-* **Syntax:** `Pandas` is more established, and its `groupby().rolling()` syntax is familiar, though it can be complex (as seen in the "duplicate label" error). `Polars` uses a more functional, expression-based API (`.over()`, `.with_columns()`) which is highly consistent and easier to parallelize.
-* **Scalability:** `Polars` is built for scalability. Its lazy API allows it to optimize entire query chains and handle datasets larger than available RAM, which `Pandas` (in its default eager mode) cannot do.
+def _table_cells(df):
+    """
+    Returns the DataFrame's cells as strings, one list per column.
 
-### 2. Threading vs. Multiprocessing (Task 3)
+    Each column is cast to strings by a single Arrow compute kernel, so
+    every cell is formatted the same way (a float 1.0 is '1'); missing
+    values are shown as 'nan'.
+    """
+    return [pc.fill_null(pc.cast(_arrow_column(df.iloc[:, i]), pa.string()), 'nan').to_pylist()
+            for i in range(df.shape[1])]
 
-* **Performance:** `Threading` was significantly faster than both `Sequential` and `Multiprocessing` for this task.
-* **The GIL (Global Interpreter Lock):** The GIL prevents multiple threads from executing Python code at the same time. However, many `pandas` operations (like `.rolling().mean()`) are C-extensions that **release the GIL**.
-* **Why Threading Won:** Because the GIL was released, other threads could start their own C-level computations. It provided true parallelism with very low overhead.
-* **Why Multiprocessing Lost:** `Multiprocessing` avoids the GIL but has massive **serialization (pickling) overhead**. The cost of pickling, sending, and un-pickling large DataFrame slices to other processes was far greater than the computational gain.
 
-### 3. Portfolio Aggregation (Task 4)
+def _markdown_lines(df, chunk_rows=10_000):
+    """
+    Yields a DataFrame (without its index) as pipe-style markdown table lines.
 
-* **Performance:** For a small portfolio, `Sequential` is often faster because the overhead of starting new processes (as `Multiprocessing` does) is higher than the task's computation time.
-* **When to use Multiprocessing:** As the number of positions grows from 3 to 3,000, `Multiprocessing` would win. The task (`compute_drawdown`, `rolling().std()`) is pure-Python and CPU-bound, making it a perfect case for avoiding the GIL, *assuming* the number of tasks is large enough to overcome the initial setup cost.
-"""
+    A light stand-in for DataFrame.to_markdown, which needs the optional
+    tabulate package and formats every cell in Python. Here the cells are
+    cast to str column by column (see _table_cells), chunk_rows rows at a
+    time, and each row is a single join.
+    """
+    yield "| " + " | ".join(map(str, df.columns)) + " |"
+    yield "|" + "|".join(["---"] * len(df.columns)) + "|"
+    for start in range(0, len(df), chunk_rows):
+        for row in zip(*_table_cells(df.iloc[start:start + chunk_rows])):
+            yield "| " + " | ".join(row) + " |"
 
-    report_content = f"""# ⚙️ Performance Comparison Report
 
-## 1. Performance Summary Table
+def to_markdown_table(df):
+    """
+    Renders a DataFrame (without its index) as a markdown table string,
+    without the tabulate package DataFrame.to_markdown needs.
+    """
+    return "\n".join(_markdown_lines(df))
 
-{summary_table}
 
-## 2. Discussion of Tradeoffs
+def _frame_key(df):
+    """
+    Returns a hashable key equal for any frames with the same columns, dtypes
+    and values, so reports can be memoized by content. The key holds only
+    the per-row hashes, never the frame itself.
+    """
+    return (
+        tuple(df.columns),
+        tuple(map(str, df.dtypes)),
+        pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()
+    )
 
-{discussion}
-"""
-    return report_content
\ No newline at end of file
+
+# Rendered reports, least recently used first
+_REPORT_CACHE = OrderedDict()
+_REPORT_CACHE_SIZE = 8
+
+
+def write_performance_report(df_performance, fp, output_format='html'):
+    """
+    Streams the performance report to a text file object, section by section
+    and (for 'md') one table row at a time, so the full report never has to
+    be held in memory.
+
+    Args:
+        df_performance (pd.DataFrame): The summary DataFrame of all metrics.
+        fp (file-like): A writable text stream, e.g. an open file.
+        output_format (str): 'html' or 'md'; see generate_performance_report.
+    """
+    if output_format not in ('html', 'md'):
+        raise ValueError(f"Unknown output_format: {output_format!r} (expected 'html' or 'md')")
+
+    fp.write(_REPORT_TITLE + "\n\n" + _SUMMARY_HEADING + "\n\n")
+
+    # Write the Summary Table...
+    if output_format == 'html':
+        df_performance.to_html(buf=fp, index=False, classes='perf', border=0)
+        fp.write("\n")
+    else:
+        for line in _markdown_lines(df_performance):
+            fp.write(line + "\n")
+
+    fp.write("\n" + _DISCUSSION_HEADING + "\n\n" + _DISCUSSION_MD + "\n")
+
+
+def generate_performance_report(df_performance, output_format='html'):
+    """
+    Generates the final performance_report.md content.
+    Reports are memoized on the frame's content, so reporting the same
+    results again returns the cached string. Use write_performance_report
+    to stream a large report straight to a file instead.
+
+    Args:
+        df_performance (pd.DataFrame): The summary DataFrame of all metrics.
+        output_format (str): 'html' embeds the summary table as an HTML
+                             <table>, which markdown renderers pass through
+                             without re-parsing; 'md' writes a markdown table.
+
+    Returns:
+        str: A string containing the full markdown report.
+    """
+    if output_format not in ('html', 'md'):
+        raise ValueError(f"Unknown output_format: {output_format!r} (expected 'html' or 'md')")
+
+    cache_key = (_frame_key(df_performance), output_format)
+    report = _REPORT_CACHE.get(cache_key)
+    if report is not None:
+        _REPORT_CACHE.move_to_end(cache_key)
+        return report
+
+    buf = io.StringIO()
+    write_performance_report(df_performance, buf, output_format)
+    report = buf.getvalue()
+    _REPORT_CACHE[cache_key] = report
+    if len(_REPORT_CACHE) > _REPORT_CACHE_SIZE:
+        _REPORT_CACHE.popitem(last=False)
+    return report